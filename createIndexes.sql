@@ -0,0 +1,26 @@
+-- This file contains the keys, foreign keys and indexes of TransportEvent and TransportEventInfo.
+-- They are not created together with the tables, as loading hundreds of millions of rows is a lot faster without
+-- them. data_integration.py drops them before a full integration and builds them afterwards (buildIndexes), several
+-- at the same time. Every statement needs to have a name, so that it can be dropped again.
+-- The tables of a group are built in parallel, the statements on the same table one after the other, as they lock
+-- each other. A group only starts once the group before has finished.
+
+-- group 1: keys and indexes
+ALTER TABLE TransportEvent ADD CONSTRAINT transportevent_pkey PRIMARY KEY (TID, Date);
+ALTER TABLE TransportEventInfo ADD CONSTRAINT transporteventinfo_pkey PRIMARY KEY (TID, Date);
+-- Filtering on the mode of transport and a date range (analysis.py)
+CREATE INDEX transportevent_produktid_date_idx ON TransportEvent (ProduktID, Date);
+-- Joining the events to their station (Map_To_Transport, TransportStation)
+CREATE INDEX transportevent_bpuic_idx ON TransportEvent (BPUIC);
+-- The events are loaded day by day, so a BRIN index on the date is tiny and still skips most of a partition
+CREATE INDEX transportevent_date_brin ON TransportEvent USING BRIN (Date);
+CREATE INDEX map_to_transport_bpuic_idx ON Map_To_Transport (BPUIC);
+
+-- group 2: foreign keys, they are checked once for all the rows instead of row by row during the load
+ALTER TABLE TransportEvent ADD CONSTRAINT transportevent_bpuic_fkey FOREIGN KEY (BPUIC) REFERENCES TransportStation(BPUIC);
+ALTER TABLE TransportEventInfo ADD CONSTRAINT transporteventinfo_tid_fkey FOREIGN KEY (TID, Date) REFERENCES TransportEvent(TID, Date);
+ALTER TABLE TransportEventInfo ADD CONSTRAINT transporteventinfo_operatorid_fkey FOREIGN KEY (OperatorID) REFERENCES TransportOperator(OperatorID);
+ALTER TABLE TransportEventInfo ADD CONSTRAINT transporteventinfo_fahrt_bezeichner_fkey FOREIGN KEY (Fahrt_Bezeichner) REFERENCES TransportJourney(Fahrt_Bezeichner);
+ALTER TABLE TransportEvent ADD CONSTRAINT transportevent_produktid_fkey FOREIGN KEY (ProduktID) REFERENCES Produkt(ProduktID);
+ALTER TABLE TransportEventInfo ADD CONSTRAINT transporteventinfo_arrivalpredstatus_fkey FOREIGN KEY (ArrivalPredStatus) REFERENCES PrognoseStatus(StatusID);
+ALTER TABLE TransportEventInfo ADD CONSTRAINT transporteventinfo_departurepredstatus_fkey FOREIGN KEY (DeparturePredStatus) REFERENCES PrognoseStatus(StatusID);
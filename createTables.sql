@@ -1,5 +1,6 @@
 -- This file contains all the necessary SQL statements to create all the tables needed for the project.
--- TODO: Add Index-Structure
+-- The keys, foreign keys and indexes of the two large tables TransportEvent and TransportEventInfo are in
+-- createIndexes.sql, they are built by data_integration.py after the data is loaded.
 
 CREATE TABLE WeatherStation (
 	Canton VARCHAR(30),
@@ -7,54 +8,96 @@ CREATE TABLE WeatherStation (
 	WeatherStationName VARCHAR(30),
 	WIGOSID VARCHAR(30),
 	DataSince DATE,
-	StationHeight FLOAT,
-	CoordE FLOAT,
-	CoordN FLOAT,
-	Lat FLOAT,
-	Long FLOAT,
+	StationHeight SMALLINT,
+	CoordE INTEGER,
+	CoordN INTEGER,
+	Lat REAL,
+	Long REAL,
 	ClimateRegion VARCHAR(40),
 	PRIMARY KEY (WeatherStationName)
 );
 
+-- Version of the tables the REST API serves with an ETag (see restAPI.py). The trigger increases it with every
+-- statement that changes the table, also when it does not go through the API.
+CREATE TABLE TableVersion (
+	TableName VARCHAR(30) PRIMARY KEY,
+	Version BIGINT NOT NULL
+);
+
+CREATE FUNCTION bump_table_version() RETURNS TRIGGER AS $$
+BEGIN
+	INSERT INTO TableVersion (TableName, Version) VALUES (TG_TABLE_NAME, 1)
+	ON CONFLICT (TableName) DO UPDATE SET Version = TableVersion.Version + 1;
+	RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER weatherstation_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON WeatherStation
+	FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();
+
 CREATE TABLE Weather (
     WeatherStationName VARCHAR(30),
     Date DATE,
-    GlobalRadiation FLOAT,
-    TotalSnowDepth FLOAT,
-    CloudCover FLOAT,
-    Pressure FLOAT,
-    Precipitation FLOAT,
-    SunshineDuration FLOAT,
-    AirTemperature_mean FLOAT,
-    AirTemperature_min FLOAT,
-    AirTemperature_max FLOAT,
-    RelativeHumidity FLOAT,
+    GlobalRadiation REAL,
+    TotalSnowDepth REAL,
+    CloudCover REAL,
+    Pressure REAL,
+    Precipitation REAL,
+    SunshineDuration REAL,
+    AirTemperature_mean REAL,
+    AirTemperature_min REAL,
+    AirTemperature_max REAL,
+    RelativeHumidity REAL,
     PRIMARY KEY (WeatherStationName, Date),
 	FOREIGN KEY (WeatherStationName) REFERENCES WeatherStation(WeatherStationName)
 );
 
+-- Mean weather of all the weather stations of a canton per day, filled by data_integration.py. The analysis joins the
+-- transport events to it on canton and date, so every event gets exactly one weather row.
+CREATE TABLE CantonWeatherDaily (
+	Canton VARCHAR(30),
+	Date DATE,
+	StationCount SMALLINT,
+	GlobalRadiation REAL,
+	TotalSnowDepth REAL,
+	CloudCover REAL,
+	Pressure REAL,
+	Precipitation REAL,
+	SunshineDuration REAL,
+	AirTemperature_mean REAL,
+	AirTemperature_min REAL,
+	AirTemperature_max REAL,
+	RelativeHumidity REAL,
+	PRIMARY KEY (Canton, Date)
+);
+
 CREATE TABLE TransportStation (
-	BPUIC FLOAT,
+	BPUIC INTEGER,
 	TStationName VARCHAR(30),
     BP_Abk VARCHAR(255),
 	Canton VARCHAR(30),
     SLOID VARCHAR(255),
-    BP_ID FLOAT,
+    BP_ID INTEGER,
+	CoordE INTEGER,
+	CoordN INTEGER,
+	Lat REAL,
+	Long REAL,
+	Height SMALLINT,
 	PRIMARY KEY (BPUIC)
 );
 
 CREATE TABLE TransportUndertaking (
-    TU_CODE FLOAT PRIMARY KEY,
+    TU_CODE INTEGER PRIMARY KEY,
     TU_BEZEICHNUNG VARCHAR(255),
     TU_ABKUERZUNG VARCHAR(30)
 );
 
 CREATE TABLE TransportStationInfo (
 	StationInfoID SERIAL PRIMARY KEY,
-	FPID FLOAT,
-	TU_Code FLOAT,
-	Fartnummer FLOAT,
-	BPUIC FLOAT,
+	FPID INTEGER,
+	TU_Code INTEGER,
+	Fartnummer INTEGER,
+	BPUIC INTEGER,
 	VM_Art VARCHAR(255),
 	Fahrtage FLOAT,
 	AB_Zeit_KB DATE,
@@ -67,28 +110,100 @@ CREATE TABLE TransportStationInfo (
 );
 
 
+-- Maps every transport station to weather stations, either to all of its canton or to its nearest ones (see
+-- mapToTransport in data_integration.py). Distance is in meters, ElevationDiff is the height of the weather station
+-- minus the height of the transport station. The weights of a transport station sum up to 1.
 CREATE TABLE Map_To_Transport (
-	BPUIC FLOAT,
+	BPUIC INTEGER,
 	WeatherStationName VARCHAR(30),
 	Canton VARCHAR(30),
+	Distance REAL,
+	ElevationDiff SMALLINT,
+	Weight REAL,
 	PRIMARY KEY (WeatherStationName, BPUIC),
 	FOREIGN KEY (WeatherStationName) REFERENCES WeatherStation(WeatherStationName),
 	FOREIGN KEY (BPUIC) REFERENCES TransportStation(BPUIC)
 );
 
-CREATE TABLE TransportEvent (
-	TID SERIAL PRIMARY KEY,
-	Date DATE,
-	BPUIC FLOAT,
-	ProduktID VARCHAR(30),
-	ArrivalTime TIMESTAMP,
-	DepartureTime TIMESTAMP,
-	FaelltAus BOOLEAN DEFAULT FALSE,
-	FOREIGN KEY (BPUIC) REFERENCES TransportStation(BPUIC)
+-- Weather at every transport station per day, the weighted mean of the weather stations it is mapped to
+-- (for ad-hoc queries, the analysis in analysis.py uses the weather of the canton in CantonWeatherDaily)
+CREATE VIEW TransportStationWeather AS
+SELECT
+	mt.BPUIC,
+	w.Date,
+	SUM(w.Precipitation * mt.Weight) / NULLIF(SUM(mt.Weight) FILTER (WHERE w.Precipitation IS NOT NULL), 0)
+		AS Precipitation,
+	SUM(w.TotalSnowDepth * mt.Weight) / NULLIF(SUM(mt.Weight) FILTER (WHERE w.TotalSnowDepth IS NOT NULL), 0)
+		AS TotalSnowDepth,
+	SUM(w.AirTemperature_mean * mt.Weight)
+		/ NULLIF(SUM(mt.Weight) FILTER (WHERE w.AirTemperature_mean IS NOT NULL), 0) AS AirTemperature_mean,
+	SUM(w.SunshineDuration * mt.Weight)
+		/ NULLIF(SUM(mt.Weight) FILTER (WHERE w.SunshineDuration IS NOT NULL), 0) AS SunshineDuration
+FROM Map_To_Transport mt
+JOIN Weather w ON mt.WeatherStationName = w.WeatherStationName
+GROUP BY mt.BPUIC, w.Date;
+
+-- Code tables for the columns of the IST-Daten with only a few different values. The large tables only store the
+-- SMALLINT code, values that are not listed here yet are added by data_integration.py.
+CREATE TABLE Produkt (
+	ProduktID SMALLSERIAL PRIMARY KEY,
+	ProduktName VARCHAR(30) UNIQUE NOT NULL
+);
+
+INSERT INTO Produkt (ProduktName) VALUES
+	('Zug'), ('Bus'), ('Tram'), ('Metro'), ('Zahnradbahn'), ('Standseilbahn'), ('Luftseilbahn'), ('Schiff');
+
+CREATE TABLE PrognoseStatus (
+	StatusID SMALLSERIAL PRIMARY KEY,
+	StatusName VARCHAR(30) UNIQUE NOT NULL
 );
 
+INSERT INTO PrognoseStatus (StatusName) VALUES ('PROGNOSE'), ('REAL'), ('GESCHAETZT'), ('UNBEKANNT');
+
+-- The TID is derived from the operating day and the row number in the IST-Daten file (see data_integration.py).
+-- The table is partitioned by month, so queries for one month only read its partition.
+-- ArrivalMinute and DepartureMinute are the minutes after midnight of the operating day (Date), they can be larger
+-- than 1440 for journeys after midnight. The view TransportEventTimes shows them as timestamps.
+CREATE TABLE TransportEvent (
+	TID BIGINT NOT NULL,
+	Date DATE NOT NULL,
+	BPUIC INTEGER,
+	ProduktID SMALLINT,
+	ArrivalMinute SMALLINT,
+	DepartureMinute SMALLINT,
+	FaelltAus BOOLEAN DEFAULT FALSE
+) PARTITION BY RANGE (Date);
+
+CREATE TABLE TransportEvent_2024_01 PARTITION OF TransportEvent FOR VALUES FROM ('2024-01-01') TO ('2024-02-01');
+CREATE TABLE TransportEvent_2024_02 PARTITION OF TransportEvent FOR VALUES FROM ('2024-02-01') TO ('2024-03-01');
+CREATE TABLE TransportEvent_2024_03 PARTITION OF TransportEvent FOR VALUES FROM ('2024-03-01') TO ('2024-04-01');
+CREATE TABLE TransportEvent_2024_04 PARTITION OF TransportEvent FOR VALUES FROM ('2024-04-01') TO ('2024-05-01');
+CREATE TABLE TransportEvent_2024_05 PARTITION OF TransportEvent FOR VALUES FROM ('2024-05-01') TO ('2024-06-01');
+CREATE TABLE TransportEvent_2024_06 PARTITION OF TransportEvent FOR VALUES FROM ('2024-06-01') TO ('2024-07-01');
+CREATE TABLE TransportEvent_2024_07 PARTITION OF TransportEvent FOR VALUES FROM ('2024-07-01') TO ('2024-08-01');
+CREATE TABLE TransportEvent_2024_08 PARTITION OF TransportEvent FOR VALUES FROM ('2024-08-01') TO ('2024-09-01');
+CREATE TABLE TransportEvent_2024_09 PARTITION OF TransportEvent FOR VALUES FROM ('2024-09-01') TO ('2024-10-01');
+CREATE TABLE TransportEvent_2024_10 PARTITION OF TransportEvent FOR VALUES FROM ('2024-10-01') TO ('2024-11-01');
+CREATE TABLE TransportEvent_2024_11 PARTITION OF TransportEvent FOR VALUES FROM ('2024-11-01') TO ('2024-12-01');
+CREATE TABLE TransportEvent_2024_12 PARTITION OF TransportEvent FOR VALUES FROM ('2024-12-01') TO ('2025-01-01');
+CREATE TABLE TransportEvent_default PARTITION OF TransportEvent DEFAULT;
+
+CREATE VIEW TransportEventTimes AS
+SELECT
+	te.TID,
+	te.Date,
+	te.BPUIC,
+	p.ProduktName,
+	te.Date + te.ArrivalMinute * INTERVAL '1 minute' AS ArrivalTime,
+	te.Date + te.DepartureMinute * INTERVAL '1 minute' AS DepartureTime,
+	te.FaelltAus
+FROM TransportEvent te
+LEFT JOIN Produkt p ON te.ProduktID = p.ProduktID;
+
+-- The OperatorID is a 31-bit CRC of the BetreiberID (see data_integration.py)
 CREATE TABLE TransportOperator (
-    BetreiberID VARCHAR(30) PRIMARY KEY,
+    OperatorID INTEGER PRIMARY KEY,
+    BetreiberID VARCHAR(30) UNIQUE NOT NULL,
     BetreiberAbk VARCHAR(30),
     BetreiberName VARCHAR(100)
 );
@@ -101,18 +216,62 @@ CREATE TABLE TransportJourney (
     VerkehrsmittelText VARCHAR(255)
 );
 
+-- Partitioned like TransportEvent, the Date is the one of the event with the same TID.
+-- ArrivalPredSecond and DeparturePredSecond are the seconds after midnight of the operating day (Date).
 CREATE TABLE TransportEventInfo (
+	TID BIGINT NOT NULL,
+	Date DATE NOT NULL,
 	Fahrt_Bezeichner VARCHAR(255),
-	BetreiberID VARCHAR(30),
-	ArrivalTimePred TIMESTAMP,
-	ArrivalPredStatus VARCHAR(30),
-	DepartureTimePred TIMESTAMP,
-	DeparturePredStatus VARCHAR(30),
+	OperatorID INTEGER,
+	ArrivalPredSecond INTEGER,
+	ArrivalPredStatus SMALLINT,
+	DeparturePredSecond INTEGER,
+	DeparturePredStatus SMALLINT,
 	Zusatzfahrt_TF BOOLEAN DEFAULT FALSE,
-	Durchfahrt_TF BOOLEAN DEFAULT FALSE,
-	TID INTEGER,
-	PRIMARY KEY (TID),
-	FOREIGN KEY (TID) REFERENCES TransportEvent(TID),
-    FOREIGN KEY (BetreiberID) REFERENCES TransportOperator(BetreiberID),
-    FOREIGN KEY (Fahrt_Bezeichner) REFERENCES TransportJourney(Fahrt_Bezeichner)
-);
\ No newline at end of file
+	Durchfahrt_TF BOOLEAN DEFAULT FALSE
+) PARTITION BY RANGE (Date);
+
+CREATE TABLE TransportEventInfo_2024_01 PARTITION OF TransportEventInfo FOR VALUES FROM ('2024-01-01') TO ('2024-02-01');
+CREATE TABLE TransportEventInfo_2024_02 PARTITION OF TransportEventInfo FOR VALUES FROM ('2024-02-01') TO ('2024-03-01');
+CREATE TABLE TransportEventInfo_2024_03 PARTITION OF TransportEventInfo FOR VALUES FROM ('2024-03-01') TO ('2024-04-01');
+CREATE TABLE TransportEventInfo_2024_04 PARTITION OF TransportEventInfo FOR VALUES FROM ('2024-04-01') TO ('2024-05-01');
+CREATE TABLE TransportEventInfo_2024_05 PARTITION OF TransportEventInfo FOR VALUES FROM ('2024-05-01') TO ('2024-06-01');
+CREATE TABLE TransportEventInfo_2024_06 PARTITION OF TransportEventInfo FOR VALUES FROM ('2024-06-01') TO ('2024-07-01');
+CREATE TABLE TransportEventInfo_2024_07 PARTITION OF TransportEventInfo FOR VALUES FROM ('2024-07-01') TO ('2024-08-01');
+CREATE TABLE TransportEventInfo_2024_08 PARTITION OF TransportEventInfo FOR VALUES FROM ('2024-08-01') TO ('2024-09-01');
+CREATE TABLE TransportEventInfo_2024_09 PARTITION OF TransportEventInfo FOR VALUES FROM ('2024-09-01') TO ('2024-10-01');
+CREATE TABLE TransportEventInfo_2024_10 PARTITION OF TransportEventInfo FOR VALUES FROM ('2024-10-01') TO ('2024-11-01');
+CREATE TABLE TransportEventInfo_2024_11 PARTITION OF TransportEventInfo FOR VALUES FROM ('2024-11-01') TO ('2024-12-01');
+CREATE TABLE TransportEventInfo_2024_12 PARTITION OF TransportEventInfo FOR VALUES FROM ('2024-12-01') TO ('2025-01-01');
+CREATE TABLE TransportEventInfo_default PARTITION OF TransportEventInfo DEFAULT;
+
+-- Daily rollup of TransportEvent per station and product, kept up to date by data_integration.py while the events are
+-- imported. A trip is delayed if DepartureMinute > ArrivalMinute, DelayMinutes is the sum of these delays.
+CREATE TABLE TransportDelayDaily (
+	Date DATE NOT NULL,
+	BPUIC INTEGER NOT NULL,
+	ProduktID SMALLINT NOT NULL,
+	Canton VARCHAR(30),
+	Trips INTEGER NOT NULL,
+	DelayedTrips INTEGER NOT NULL,
+	CancelledTrips INTEGER NOT NULL,
+	DelayMinutes BIGINT NOT NULL,
+	PRIMARY KEY (Date, BPUIC, ProduktID)
+);
+
+-- Keeps track of every file imported by data_integration.py and the tables it was imported into. Files that are
+-- committed here are skipped, so an interrupted integration continues where it stopped.
+-- rebuildDelayRollup and mapToTransport, which fill a table from scratch, are listed here under their name as well.
+CREATE TABLE IngestionManifest (
+	FilePath VARCHAR(255),
+	TargetTable VARCHAR(30),
+	FileSize BIGINT,
+	FileMtime BIGINT,
+	FileHash VARCHAR(64),
+	RowCount BIGINT,
+	Status VARCHAR(30),
+	StartedAt TIMESTAMP,
+	FinishedAt TIMESTAMP,
+	Error TEXT,
+	PRIMARY KEY (FilePath, TargetTable)
+);
@@ -0,0 +1,205 @@
+import contextlib
+import functools
+import json
+import os
+import time
+from datetime import datetime
+import pandas as pd
+import psycopg2.extensions
+
+try:
+    import resource
+except ImportError:  # not available on Windows, the peak memory is not recorded there
+    resource = None
+
+# This file contains the instrumentation of the integration and the analysis. Every stage (an import function, a
+# file, a chunk of a file, a query, ...) is timed with stage() and written as one JSON line into METRICS_FILE, with
+# its wall and CPU time, the rows it read and wrote, the rows per second, the peak memory of the process and the
+# number of database round trips. summary() prints the totals per stage of a run.
+# Worker processes append to the same file, all lines of one run share the same run id.
+
+METRICS_FILE = 'metrics.jsonl'
+
+# The stages with these names are profiled, with cProfile ('cprofile') or pyinstrument ('pyinstrument'). The profiles
+# are written into PROFILE_DIRECTORY, one file per stage and process.
+PROFILE_STAGES = set()
+PROFILER = 'cprofile'
+PROFILE_DIRECTORY = 'profiles'
+
+# The run id is passed on to the worker processes through the environment
+RUN_ID = os.environ.setdefault('INSTRUMENTATION_RUN', f"{datetime.now():%Y%m%d-%H%M%S}-{os.getpid()}")
+
+round_trips = 0
+active_profile = None
+
+
+# Cursor that counts every statement it sends to the database. Both the raw connections (COPY, executemany) and the
+# SQLAlchemy connections use it, when the engine is created with connect_args=CONNECT_ARGS.
+class CountingCursor(psycopg2.extensions.cursor):
+    def execute(self, query, vars=None):
+        global round_trips
+        round_trips += 1
+        return super().execute(query, vars)
+
+    def executemany(self, query, vars_list):
+        global round_trips
+        round_trips += 1
+        return super().executemany(query, vars_list)
+
+    def copy_expert(self, sql, file, size=8192):
+        global round_trips
+        round_trips += 1
+        return super().copy_expert(sql, file, size)
+
+
+CONNECT_ARGS = {'cursor_factory': CountingCursor}
+
+
+# Returns the peak memory of the current process in MB, or None where it is not available
+def peakRss():
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+# Returns the number of rows of a result: the length of a DataFrame, an int, or the sum of a dict of row counts
+def countRows(result):
+    if isinstance(result, (pd.DataFrame, pd.Series)):
+        return len(result)
+    if isinstance(result, dict) and all(isinstance(value, int) for value in result.values()):
+        return sum(result.values())
+    if isinstance(result, int) and not isinstance(result, bool):
+        return result
+    return None
+
+
+# Appends one record to METRICS_FILE. The lines are short, so records of several processes do not mix.
+def writeRecord(record):
+    directory = os.path.dirname(METRICS_FILE)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(METRICS_FILE, 'a') as file:
+        file.write(json.dumps(record, default=str) + '\n')
+
+
+# Starts the profiler for a stage, unless it is not in PROFILE_STAGES or another stage is profiled already. Returns a
+# function that stops the profiler and writes the profile.
+def startProfile(name):
+    global active_profile
+    if name not in PROFILE_STAGES or active_profile is not None:
+        return None
+    os.makedirs(PROFILE_DIRECTORY, exist_ok=True)
+    path = os.path.join(PROFILE_DIRECTORY, f"{name}-{os.getpid()}-{time.time_ns()}")
+
+    if PROFILER == 'pyinstrument':
+        from pyinstrument import Profiler  # only needed when profiling with pyinstrument
+        profiler = Profiler()
+        profiler.start()
+
+        def stop():
+            profiler.stop()
+            with open(path + '.html', 'w') as file:
+                file.write(profiler.output_html())
+    else:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+        def stop():
+            profiler.disable()
+            profiler.dump_stats(path + '.prof')
+
+    active_profile = name
+    return stop
+
+
+# Times the code inside the with block as the stage name and writes its metrics. The keyword arguments are written
+# with it (e.g. the file). The block can set 'rows_in' and 'rows_out' and any other field in the yielded dict.
+@contextlib.contextmanager
+def stage(name, **fields):
+    global active_profile
+    metrics = dict(fields)
+    stop_profile = startProfile(name)
+    start_trips = round_trips
+    start_wall = time.perf_counter()
+    start_cpu = time.process_time()
+    try:
+        yield metrics
+    except BaseException as error:
+        metrics['error'] = repr(error)
+        raise
+    finally:
+        wall = time.perf_counter() - start_wall
+        if stop_profile is not None:
+            stop_profile()
+            active_profile = None
+        rows_out = metrics.get('rows_out')
+        writeRecord({
+            'run': RUN_ID,
+            'time': datetime.now().isoformat(timespec='seconds'),
+            'pid': os.getpid(),
+            'stage': name,
+            **metrics,
+            'wall_seconds': round(wall, 4),
+            'cpu_seconds': round(time.process_time() - start_cpu, 4),
+            'rows_per_second': round(rows_out / wall) if rows_out and wall > 0 else None,
+            'peak_rss_mb': peakRss(),
+            'round_trips': round_trips - start_trips,
+        })
+
+
+# Decorator that runs the function as a stage with its name. The rows it returns are recorded as 'rows_out'.
+def instrumented(function):
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        with stage(function.__name__) as metrics:
+            result = function(*args, **kwargs)
+            metrics['rows_out'] = countRows(result)
+            return result
+    return wrapper
+
+
+# Wraps an iterator so that producing every item is timed as the stage name (e.g. parsing the next chunk of a file)
+def timedIterator(name, iterable, **fields):
+    iterator = iter(iterable)
+    index = 0
+    while True:
+        with stage(name, chunk=index, **fields) as metrics:
+            try:
+                item = next(iterator)
+            except StopIteration:
+                metrics['rows_out'] = 0
+                return
+            metrics['rows_out'] = countRows(item)
+        yield item
+        index += 1
+
+
+# Reads the metrics of a run (by default the current one) into a DataFrame
+def readMetrics(run=None):
+    run = run or RUN_ID
+    if not os.path.exists(METRICS_FILE):
+        return pd.DataFrame()
+    with open(METRICS_FILE) as file:
+        records = [record for record in map(json.loads, file) if record['run'] == run]
+    return pd.DataFrame(records)
+
+
+# Prints the totals of every stage of a run (by default the current one) and returns them, the slowest stage first
+def summary(run=None):
+    metrics = readMetrics(run)
+    if metrics.empty:
+        print("No metrics recorded")
+        return metrics
+    for column in ['rows_in', 'rows_out', 'peak_rss_mb']:
+        if column not in metrics:
+            metrics[column] = None
+    totals = metrics.groupby('stage').agg(
+        calls=('stage', 'size'), wall_seconds=('wall_seconds', 'sum'), cpu_seconds=('cpu_seconds', 'sum'),
+        rows_in=('rows_in', 'sum'), rows_out=('rows_out', 'sum'), peak_rss_mb=('peak_rss_mb', 'max'),
+        round_trips=('round_trips', 'sum')).sort_values('wall_seconds', ascending=False)
+    totals['rows_per_second'] = (totals['rows_out'] / totals['wall_seconds'].where(totals['wall_seconds'] > 0)).round()
+    with pd.option_context('display.max_rows', None, 'display.max_columns', None, 'display.width', 160):
+        print(f"Metrics of run {run or RUN_ID}:")
+        print(totals.round(2))
+    return totals
@@ -0,0 +1,240 @@
+-- This file migrates a database created with an older createTables.sql to the compact column types (integer keys,
+-- code tables for products and prediction statuses, times as minutes/seconds of the operating day).
+-- Do not run it by hand, run migrateCompactTypes() in data_integration.py. It drops the indexes of the transport
+-- tables first, fills TransportOperator.OperatorID, runs this file and builds the indexes again afterwards.
+-- Every ALTER TABLE changes all of its columns at once, so every table is rewritten only once.
+-- The tables are not partitioned by this migration, for that the transport data needs to be imported again.
+-- The tables and columns that were added to createTables.sql later are created as well, if they do not exist yet.
+
+-- Databases from before the TIDs were derived from the operating day, TransportEventInfo gets the Date of its event
+ALTER TABLE TransportEventInfo DROP CONSTRAINT IF EXISTS transporteventinfo_betreiberid_fkey;
+ALTER TABLE TransportEvent ALTER COLUMN TID DROP DEFAULT;
+ALTER TABLE TransportEvent ALTER COLUMN TID TYPE BIGINT;
+ALTER TABLE TransportEventInfo ALTER COLUMN TID TYPE BIGINT;
+ALTER TABLE TransportEventInfo ADD COLUMN IF NOT EXISTS Date DATE;
+UPDATE TransportEventInfo ei SET Date = te.Date FROM TransportEvent te WHERE ei.TID = te.TID AND ei.Date IS NULL;
+
+-- The TIDs are renumbered into the block of their operating day, as data_integration.py derives them: the n-th event
+-- of a day gets (Date - 2000-01-01) * 10000000 + n. Otherwise importing a day again would not replace its events.
+-- The keys on the TIDs are dropped by migrateCompactTypes() before.
+CREATE TEMPORARY TABLE tid_map ON COMMIT DROP AS
+SELECT TID AS OldTID, (Date - DATE '2000-01-01')::BIGINT * 10000000 + row_number() OVER (PARTITION BY Date ORDER BY TID)
+	AS NewTID
+FROM TransportEvent;
+UPDATE TransportEventInfo ei SET TID = m.NewTID FROM tid_map m WHERE ei.TID = m.OldTID;
+UPDATE TransportEvent te SET TID = m.NewTID FROM tid_map m WHERE te.TID = m.OldTID;
+
+-- Code tables, with all the values that are already in the database
+CREATE TABLE IF NOT EXISTS Produkt (
+	ProduktID SMALLSERIAL PRIMARY KEY,
+	ProduktName VARCHAR(30) UNIQUE NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS PrognoseStatus (
+	StatusID SMALLSERIAL PRIMARY KEY,
+	StatusName VARCHAR(30) UNIQUE NOT NULL
+);
+
+INSERT INTO Produkt (ProduktName)
+SELECT DISTINCT ProduktID FROM TransportEvent WHERE ProduktID IS NOT NULL
+ON CONFLICT (ProduktName) DO NOTHING;
+
+INSERT INTO PrognoseStatus (StatusName)
+SELECT ArrivalPredStatus FROM TransportEventInfo WHERE ArrivalPredStatus IS NOT NULL
+UNION
+SELECT DeparturePredStatus FROM TransportEventInfo WHERE DeparturePredStatus IS NOT NULL
+ON CONFLICT (StatusName) DO NOTHING;
+
+-- A subquery is not allowed when changing the type of a column, a function is
+CREATE FUNCTION produkt_code(name TEXT) RETURNS SMALLINT AS
+	'SELECT ProduktID FROM Produkt WHERE ProduktName = name' LANGUAGE SQL STABLE;
+CREATE FUNCTION status_code(name TEXT) RETURNS SMALLINT AS
+	'SELECT StatusID FROM PrognoseStatus WHERE StatusName = name' LANGUAGE SQL STABLE;
+CREATE FUNCTION operator_code(name TEXT) RETURNS INTEGER AS
+	'SELECT OperatorID FROM TransportOperator WHERE BetreiberID = name' LANGUAGE SQL STABLE;
+
+-- The foreign keys between the station tables need to be dropped while their types are changed
+ALTER TABLE TransportStationInfo DROP CONSTRAINT IF EXISTS transportstationinfo_bpuic_fkey,
+	DROP CONSTRAINT IF EXISTS transportstationinfo_tu_code_fkey;
+ALTER TABLE Map_To_Transport DROP CONSTRAINT IF EXISTS map_to_transport_bpuic_fkey;
+
+ALTER TABLE WeatherStation
+	ALTER COLUMN StationHeight TYPE SMALLINT USING round(StationHeight)::SMALLINT,
+	ALTER COLUMN CoordE TYPE INTEGER USING round(CoordE)::INTEGER,
+	ALTER COLUMN CoordN TYPE INTEGER USING round(CoordN)::INTEGER,
+	ALTER COLUMN Lat TYPE REAL,
+	ALTER COLUMN Long TYPE REAL;
+
+ALTER TABLE Weather
+	ALTER COLUMN GlobalRadiation TYPE REAL,
+	ALTER COLUMN TotalSnowDepth TYPE REAL,
+	ALTER COLUMN CloudCover TYPE REAL,
+	ALTER COLUMN Pressure TYPE REAL,
+	ALTER COLUMN Precipitation TYPE REAL,
+	ALTER COLUMN SunshineDuration TYPE REAL,
+	ALTER COLUMN AirTemperature_mean TYPE REAL,
+	ALTER COLUMN AirTemperature_min TYPE REAL,
+	ALTER COLUMN AirTemperature_max TYPE REAL,
+	ALTER COLUMN RelativeHumidity TYPE REAL;
+
+ALTER TABLE TransportStation
+	ALTER COLUMN BPUIC TYPE INTEGER USING BPUIC::INTEGER,
+	ALTER COLUMN BP_ID TYPE INTEGER USING BP_ID::INTEGER;
+
+ALTER TABLE TransportUndertaking
+	ALTER COLUMN TU_CODE TYPE INTEGER USING TU_CODE::INTEGER;
+
+ALTER TABLE TransportStationInfo
+	ALTER COLUMN FPID TYPE INTEGER USING FPID::INTEGER,
+	ALTER COLUMN TU_Code TYPE INTEGER USING TU_Code::INTEGER,
+	ALTER COLUMN Fartnummer TYPE INTEGER USING Fartnummer::INTEGER,
+	ALTER COLUMN BPUIC TYPE INTEGER USING BPUIC::INTEGER;
+
+ALTER TABLE Map_To_Transport
+	ALTER COLUMN BPUIC TYPE INTEGER USING BPUIC::INTEGER;
+
+ALTER TABLE TransportStationInfo
+	ADD CONSTRAINT transportstationinfo_bpuic_fkey FOREIGN KEY (BPUIC) REFERENCES TransportStation(BPUIC),
+	ADD CONSTRAINT transportstationinfo_tu_code_fkey FOREIGN KEY (TU_CODE) REFERENCES TransportUndertaking(TU_CODE);
+ALTER TABLE Map_To_Transport
+	ADD CONSTRAINT map_to_transport_bpuic_fkey FOREIGN KEY (BPUIC) REFERENCES TransportStation(BPUIC);
+
+-- The times are stored relative to the operating day
+ALTER TABLE TransportEvent
+	ALTER COLUMN BPUIC TYPE INTEGER USING BPUIC::INTEGER,
+	ALTER COLUMN ProduktID TYPE SMALLINT USING produkt_code(ProduktID),
+	ALTER COLUMN ArrivalTime TYPE SMALLINT USING (EXTRACT(EPOCH FROM ArrivalTime - Date) / 60)::SMALLINT,
+	ALTER COLUMN DepartureTime TYPE SMALLINT USING (EXTRACT(EPOCH FROM DepartureTime - Date) / 60)::SMALLINT;
+ALTER TABLE TransportEvent RENAME COLUMN ArrivalTime TO ArrivalMinute;
+ALTER TABLE TransportEvent RENAME COLUMN DepartureTime TO DepartureMinute;
+
+ALTER TABLE TransportEventInfo
+	ALTER COLUMN BetreiberID TYPE INTEGER USING operator_code(BetreiberID),
+	ALTER COLUMN ArrivalTimePred TYPE INTEGER USING EXTRACT(EPOCH FROM ArrivalTimePred - Date)::INTEGER,
+	ALTER COLUMN ArrivalPredStatus TYPE SMALLINT USING status_code(ArrivalPredStatus),
+	ALTER COLUMN DepartureTimePred TYPE INTEGER USING EXTRACT(EPOCH FROM DepartureTimePred - Date)::INTEGER,
+	ALTER COLUMN DeparturePredStatus TYPE SMALLINT USING status_code(DeparturePredStatus);
+ALTER TABLE TransportEventInfo RENAME COLUMN BetreiberID TO OperatorID;
+ALTER TABLE TransportEventInfo RENAME COLUMN ArrivalTimePred TO ArrivalPredSecond;
+ALTER TABLE TransportEventInfo RENAME COLUMN DepartureTimePred TO DeparturePredSecond;
+
+-- TransportOperator is only switched to the OperatorID as key once nothing refers to the BetreiberID anymore
+ALTER TABLE TransportOperator DROP CONSTRAINT transportoperator_pkey;
+ALTER TABLE TransportOperator ADD PRIMARY KEY (OperatorID);
+ALTER TABLE TransportOperator ADD CONSTRAINT transportoperator_betreiberid_key UNIQUE (BetreiberID);
+ALTER TABLE TransportOperator ALTER COLUMN BetreiberID SET NOT NULL;
+
+DROP FUNCTION produkt_code(TEXT);
+DROP FUNCTION status_code(TEXT);
+DROP FUNCTION operator_code(TEXT);
+
+CREATE VIEW TransportEventTimes AS
+SELECT
+	te.TID,
+	te.Date,
+	te.BPUIC,
+	p.ProduktName,
+	te.Date + te.ArrivalMinute * INTERVAL '1 minute' AS ArrivalTime,
+	te.Date + te.DepartureMinute * INTERVAL '1 minute' AS DepartureTime,
+	te.FaelltAus
+FROM TransportEvent te
+LEFT JOIN Produkt p ON te.ProduktID = p.ProduktID;
+
+-- Coordinates and heights of the transport stations, filled by importTransportStationCoordinates()
+ALTER TABLE TransportStation
+	ADD COLUMN IF NOT EXISTS CoordE INTEGER,
+	ADD COLUMN IF NOT EXISTS CoordN INTEGER,
+	ADD COLUMN IF NOT EXISTS Lat REAL,
+	ADD COLUMN IF NOT EXISTS Long REAL,
+	ADD COLUMN IF NOT EXISTS Height SMALLINT;
+
+-- The existing mapping is the one by canton, where all the weather stations of the canton count the same. Distance
+-- and ElevationDiff are only filled by mapToTransport(mode='nearest').
+ALTER TABLE Map_To_Transport
+	ADD COLUMN IF NOT EXISTS Distance REAL,
+	ADD COLUMN IF NOT EXISTS ElevationDiff SMALLINT,
+	ADD COLUMN IF NOT EXISTS Weight REAL;
+UPDATE Map_To_Transport mt SET Weight = 1.0 / c.Stations
+FROM (SELECT BPUIC, COUNT(*) AS Stations FROM Map_To_Transport GROUP BY BPUIC) c
+WHERE mt.BPUIC = c.BPUIC AND mt.Weight IS NULL;
+
+CREATE OR REPLACE VIEW TransportStationWeather AS
+SELECT
+	mt.BPUIC,
+	w.Date,
+	SUM(w.Precipitation * mt.Weight) / NULLIF(SUM(mt.Weight) FILTER (WHERE w.Precipitation IS NOT NULL), 0)
+		AS Precipitation,
+	SUM(w.TotalSnowDepth * mt.Weight) / NULLIF(SUM(mt.Weight) FILTER (WHERE w.TotalSnowDepth IS NOT NULL), 0)
+		AS TotalSnowDepth,
+	SUM(w.AirTemperature_mean * mt.Weight)
+		/ NULLIF(SUM(mt.Weight) FILTER (WHERE w.AirTemperature_mean IS NOT NULL), 0) AS AirTemperature_mean,
+	SUM(w.SunshineDuration * mt.Weight)
+		/ NULLIF(SUM(mt.Weight) FILTER (WHERE w.SunshineDuration IS NOT NULL), 0) AS SunshineDuration
+FROM Map_To_Transport mt
+JOIN Weather w ON mt.WeatherStationName = w.WeatherStationName
+GROUP BY mt.BPUIC, w.Date;
+
+-- Version of the tables the REST API serves with an ETag (see restAPI.py). The trigger increases it with every
+-- statement that changes the table, also when it does not go through the API.
+CREATE TABLE IF NOT EXISTS TableVersion (
+	TableName VARCHAR(30) PRIMARY KEY,
+	Version BIGINT NOT NULL
+);
+
+CREATE OR REPLACE FUNCTION bump_table_version() RETURNS TRIGGER AS $$
+BEGIN
+	INSERT INTO TableVersion (TableName, Version) VALUES (TG_TABLE_NAME, 1)
+	ON CONFLICT (TableName) DO UPDATE SET Version = TableVersion.Version + 1;
+	RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+DROP TRIGGER IF EXISTS weatherstation_version ON WeatherStation;
+
+CREATE TRIGGER weatherstation_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON WeatherStation
+	FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();
+
+-- Filled by buildCantonWeatherDaily(), which runs after the weather measurements are imported
+CREATE TABLE IF NOT EXISTS CantonWeatherDaily (
+	Canton VARCHAR(30),
+	Date DATE,
+	StationCount SMALLINT,
+	GlobalRadiation REAL,
+	TotalSnowDepth REAL,
+	CloudCover REAL,
+	Pressure REAL,
+	Precipitation REAL,
+	SunshineDuration REAL,
+	AirTemperature_mean REAL,
+	AirTemperature_min REAL,
+	AirTemperature_max REAL,
+	RelativeHumidity REAL,
+	PRIMARY KEY (Canton, Date)
+);
+
+-- Filled for the existing events by rebuildDelayRollup()
+CREATE TABLE IF NOT EXISTS TransportDelayDaily (
+	Date DATE NOT NULL,
+	BPUIC INTEGER NOT NULL,
+	ProduktID SMALLINT NOT NULL,
+	Canton VARCHAR(30),
+	Trips INTEGER NOT NULL,
+	DelayedTrips INTEGER NOT NULL,
+	CancelledTrips INTEGER NOT NULL,
+	DelayMinutes BIGINT NOT NULL,
+	PRIMARY KEY (Date, BPUIC, ProduktID)
+);
+
+-- Filled with the files that were imported before the migration by seedManifest() in data_integration.py
+CREATE TABLE IF NOT EXISTS IngestionManifest (
+	FilePath VARCHAR(255),
+	TargetTable VARCHAR(30),
+	FileSize BIGINT,
+	FileMtime BIGINT,
+	FileHash VARCHAR(64),
+	RowCount BIGINT,
+	Status VARCHAR(30),
+	StartedAt TIMESTAMP,
+	FinishedAt TIMESTAMP,
+	Error TEXT,
+	PRIMARY KEY (FilePath, TargetTable)
+);
@@ -1,5 +1,22 @@
-from flask import Flask, request, jsonify
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from datetime import date
+from flask import Flask, Response, request, jsonify
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import literal_column, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import DBAPIError
+from urllib.parse import quote
+from werkzeug.http import http_date
+
+try:
+    import orjson  # faster JSON serializer, used when it is installed
+except ImportError:
+    orjson = None
 
 # This file contains the implementation of the REST API.
 # With the REST API one is able to access the weatherstation table.
@@ -7,6 +24,7 @@ from flask_sqlalchemy import SQLAlchemy
 # To interact with it, one needs to run the main function of this script and then use a command
 # in the terminal with similar structure as this 'curl -X GET http://127.0.0.1:5000/weatherstation'.
 # This command would return the user the information on all weather stations.
+# Besides that, /delays and /delays/daily return delay and cancellation rates from the daily rollup (see below).
 
 app = Flask(__name__)
 
@@ -25,34 +43,105 @@ class WeatherStation(db.Model):
     station = db.Column(db.String(30))
     wigosid = db.Column(db.String(30))
     datasince = db.Column(db.Date)
-    stationheight = db.Column(db.Float)
-    coorde = db.Column(db.Float)
-    coordn = db.Column(db.Float)
-    lat = db.Column(db.Float)
-    long = db.Column(db.Float)
+    stationheight = db.Column(db.SmallInteger)
+    coorde = db.Column(db.Integer)
+    coordn = db.Column(db.Integer)
+    lat = db.Column(db.REAL)
+    long = db.Column(db.REAL)
     climateregion = db.Column(db.String(40))
 
 
-# GET: Retrieve all weather stations
+# The fields of a weather station in the JSON responses, and the columns they come from
+STATION_FIELDS = {
+    "WeatherStationName": WeatherStation.weatherstationname,
+    "Canton": WeatherStation.canton,
+    "Station": WeatherStation.station,
+    "WIGOSID": WeatherStation.wigosid,
+    "DataSince": WeatherStation.datasince,
+    "StationHeight": WeatherStation.stationheight,
+    "CoordE": WeatherStation.coorde,
+    "CoordN": WeatherStation.coordn,
+    "Lat": WeatherStation.lat,
+    "Long": WeatherStation.long,
+    "ClimateRegion": WeatherStation.climateregion,
+}
+
+# The listing returns at most this many weather stations at once, the next page is linked in the Link header
+MAX_PAGE_SIZE = 1000
+
+# Returns the version of a table, which a trigger increases with every statement that changes it (see TableVersion in
+# createTables.sql), no matter whether it runs in this process, another process of the API or data_integration.py.
+# It makes up the ETag of the listing, so a client polling an unchanged table gets a 304 after this one small query.
+def tableVersion(table):
+    return db.session.execute(text("SELECT version FROM tableversion WHERE tablename = :table"),
+                              {'table': table}).scalar() or 0
+
+
+# Turns a row into its JSON fields. DataSince is written like jsonify writes dates.
+def stationJson(row, fields):
+    station = {field: getattr(row, STATION_FIELDS[field].key) for field in fields}
+    if station.get("DataSince") is not None:
+        station["DataSince"] = http_date(station["DataSince"])
+    return station
+
+
+# Serializes the response with orjson if it is installed, otherwise with json. Dates are written as YYYY-MM-DD.
+def jsonResponse(data, status=200):
+    return Response(serializeJson(data), status=status, mimetype='application/json')
+
+
+def serializeJson(data):
+    return orjson.dumps(data) if orjson is not None else json.dumps(data, separators=(',', ':'), default=str)
+
+
+# GET: Retrieve all weather stations, ordered by name
 # command: curl -X GET http://127.0.0.1:5000/weatherstation
+# Optional query parameters:
+#   fields=WeatherStationName,Canton     only returns these fields
+#   canton=ZH,BE / climateregion=...     only returns the stations in these cantons / climate regions
+#   limit=100&after=XXX                  returns at most 100 stations after the station XXX (keyset pagination), the
+#                                        link to the next page is in the Link header
+# The response has an ETag, with 'If-None-Match' an unchanged result is answered with 304 Not Modified.
 @app.route('/weatherstation', methods=['GET'])
 def get_weatherstations():
-    stations = WeatherStation.query.all()
-    return jsonify([
-        {
-            "WeatherStationName": station.weatherstationname,
-            "Canton": station.canton,
-            "Station": station.station,
-            "WIGOSID": station.wigosid,
-            "DataSince": station.datasince,
-            "StationHeight": station.stationheight,
-            "CoordE": station.coorde,
-            "CoordN": station.coordn,
-            "Lat": station.lat,
-            "Long": station.long,
-            "ClimateRegion": station.climateregion,
-        } for station in stations
-    ])
+    # The version is read before the stations, so a change in between never gets the ETag of the new version
+    version = tableVersion('weatherstation')
+    etag = hashlib.sha1(f"{version}-{sorted(request.args.items(multi=True))}".encode()).hexdigest()
+    if etag in request.if_none_match:
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+
+    fields = request.args.get('fields', ','.join(STATION_FIELDS)).split(',')
+    unknown = [field for field in fields if field not in STATION_FIELDS]
+    if unknown:
+        return jsonify({"error": f"Unknown fields: {', '.join(unknown)}"}), 400
+    try:
+        limit = min(int(request.args.get('limit', MAX_PAGE_SIZE)), MAX_PAGE_SIZE)
+    except ValueError:
+        return jsonify({"error": "limit needs to be a number"}), 400
+    if limit < 1:
+        return jsonify({"error": "limit needs to be at least 1"}), 400
+
+    # Only the requested columns are read, the name is always read for the pagination
+    columns = {STATION_FIELDS[field] for field in fields} | {WeatherStation.weatherstationname}
+    query = db.session.query(*columns)
+    for parameter, column in [('canton', WeatherStation.canton), ('climateregion', WeatherStation.climateregion)]:
+        if parameter in request.args:
+            query = query.filter(column.in_(request.args[parameter].split(',')))
+    if 'after' in request.args:
+        query = query.filter(WeatherStation.weatherstationname > request.args['after'])
+    rows = query.order_by(WeatherStation.weatherstationname).limit(limit + 1).all()
+
+    response = jsonResponse([stationJson(row, fields) for row in rows[:limit]])
+    if len(rows) > limit:
+        args = request.args.to_dict()
+        args.update(after=rows[limit - 1].weatherstationname, limit=limit)
+        next_url = request.base_url + '?' + '&'.join(f"{key}={quote(str(value))}" for key, value in args.items())
+        response.headers['Link'] = f'<{next_url}>; rel="next"'
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'  # clients may keep the result, but need to check the ETag
+    return response
 
 
 # GET: Retrieve a specific weather station by name
@@ -63,19 +152,7 @@ def get_weatherstation(weatherstation_name):
     station = WeatherStation.query.get(weatherstation_name)
     if not station:
         return jsonify({"error": f"WeatherStation '{weatherstation_name}' not found"}), 404
-    return jsonify({
-        "WeatherStationName": station.weatherstationname,
-        "Canton": station.canton,
-        "Station": station.station,
-        "WIGOSID": station.wigosid,
-        "DataSince": station.datasince,
-        "StationHeight": station.stationheight,
-        "CoordE": station.coorde,
-        "CoordN": station.coordn,
-        "Lat": station.lat,
-        "Long": station.long,
-        "ClimateRegion": station.climateregion,
-    })
+    return jsonify(stationJson(station, STATION_FIELDS))
 
 
 # POST: Add a new weather station
@@ -95,6 +172,118 @@ def add_weatherstation():
     return jsonify({"message": "WeatherStation added successfully"}), 201
 
 
+# The bulk endpoint upserts this many stations with one statement
+BULK_BATCH_SIZE = 1000
+
+# Content types of a request body with one JSON station per line (NDJSON)
+NDJSON_TYPES = {'application/x-ndjson', 'application/ndjson', 'application/jsonl'}
+
+
+# Reads the stations of a bulk request, either a JSON array or NDJSON. Returns the stations and the errors of the
+# lines that could not be read, by their index. Raises ValueError if the body is no JSON array.
+def readBulkStations():
+    if request.mimetype in NDJSON_TYPES:
+        stations = []
+        errors = {}
+        lines = [line for line in request.get_data(as_text=True).splitlines() if line.strip()]
+        for index, line in enumerate(lines):
+            try:
+                stations.append(json.loads(line))
+            except json.JSONDecodeError as error:
+                stations.append(None)
+                errors[index] = f"Invalid JSON: {error}"
+        return stations, errors
+
+    stations = request.get_json(silent=True)
+    if not isinstance(stations, list):
+        raise ValueError("The body needs to be a JSON array or NDJSON")
+    return stations, {}
+
+
+# Upserts rows with the same columns in one INSERT ... ON CONFLICT statement. Returns for every weather station name
+# whether it was inserted (True) or updated (False).
+def upsertStations(rows):
+    statement = insert(WeatherStation).values(rows)
+    columns = [column for column in rows[0] if column != 'weatherstationname']
+    if columns:
+        statement = statement.on_conflict_do_update(
+            index_elements=['weatherstationname'], set_={column: statement.excluded[column] for column in columns})
+    else:
+        statement = statement.on_conflict_do_nothing(index_elements=['weatherstationname'])
+    # xmax is 0 for a row that was inserted by the statement and set for a row it updated
+    statement = statement.returning(WeatherStation.weatherstationname, literal_column('xmax = 0').label('inserted'))
+    return {row.weatherstationname: row.inserted for row in db.session.execute(statement)}
+
+
+# POST: Add or update many weather stations at once
+# To run this one needs to run this command:
+# curl -X POST http://127.0.0.1:5000/weatherstation/bulk \
+# -H "Content-Type: application/json" \
+# -d '[{ ... }, { ... }]'
+# Inside the array one needs to input the weather stations, like for POST. With the Content-Type
+# application/x-ndjson the body can also hold one weather station per line. A station that already exists is updated
+# with the given variables. The stations are written with one statement per BULK_BATCH_SIZE stations, in one
+# transaction. The response holds the result of every station, in the order of the request.
+@app.route('/weatherstation/bulk', methods=['POST'])
+def bulk_weatherstations():
+    try:
+        stations, errors = readBulkStations()
+    except ValueError as error:
+        return jsonify({"error": str(error)}), 400
+
+    # Check every station, the valid ones are grouped by their variables so that each statement has the same columns
+    known_columns = set(WeatherStation.__table__.columns.keys())
+    last_index = {}
+    for index, station in enumerate(stations):
+        if index in errors:
+            continue
+        if not isinstance(station, dict) or not isinstance(station.get('weatherstationname'), str):
+            errors[index] = "A weather station needs to be an object with a weatherstationname"
+        elif set(station) - known_columns:
+            errors[index] = f"Unknown variables: {', '.join(sorted(set(station) - known_columns))}"
+        else:
+            if station['weatherstationname'] in last_index:
+                errors[last_index[station['weatherstationname']]] = "Replaced by a later entry of the same station"
+            last_index[station['weatherstationname']] = index
+    groups = {}
+    for index in sorted(last_index.values()):
+        groups.setdefault(tuple(sorted(stations[index])), []).append(index)
+
+    # A batch that fails is written again station by station, so only the stations that fail are reported
+    inserted = {}
+    for indexes in groups.values():
+        for start in range(0, len(indexes), BULK_BATCH_SIZE):
+            batch = indexes[start:start + BULK_BATCH_SIZE]
+            try:
+                with db.session.begin_nested():
+                    inserted.update(upsertStations([stations[index] for index in batch]))
+            except DBAPIError:
+                for index in batch:
+                    try:
+                        with db.session.begin_nested():
+                            inserted.update(upsertStations([stations[index]]))
+                    except DBAPIError as error:
+                        errors[index] = str(error.orig).strip()
+    db.session.commit()
+
+    results = []
+    for index, station in enumerate(stations):
+        name = station.get('weatherstationname') if isinstance(station, dict) else None
+        if index in errors:
+            results.append({"index": index, "weatherstationname": name, "status": "error", "error": errors[index]})
+        elif name in inserted:
+            results.append({"index": index, "weatherstationname": name,
+                            "status": "created" if inserted[name] else "updated"})
+        else:
+            results.append({"index": index, "weatherstationname": name, "status": "unchanged"})
+    return jsonResponse({
+        "created": sum(result["status"] == "created" for result in results),
+        "updated": sum(result["status"] == "updated" for result in results),
+        "errors": len(errors),
+        "results": results,
+    })
+
+
 # PUT: Update an existing weather station
 # To run this one needs to run this command:
 # curl -X PUT http://127.0.0.1:5000/weatherstation/XXX \
@@ -129,6 +318,167 @@ def delete_weatherstation(weatherstation_name):
     return jsonify({"message": "WeatherStation deleted successfully"})
 
 
+# In-process cache for the results of the aggregate endpoints below. It keeps at most max_entries results, each for
+# ttl seconds, and drops the least recently used result first. If the same result is requested again while its query
+# is still running, the request waits for that query instead of running it a second time.
+class ResultCache:
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()  # key -> (expiry time, result)
+        self.pending = {}  # key -> Future of the query that is running
+        self.lock = threading.Lock()
+
+    # Returns the cached result of key, or computes it with compute()
+    def get(self, key, compute):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self.entries.move_to_end(key)
+                return entry[1]
+            future = self.pending.get(key)
+            running = future is not None
+            if not running:
+                future = Future()
+                self.pending[key] = future
+        if running:
+            return future.result()
+
+        try:
+            result = compute()
+        except Exception as error:
+            with self.lock:
+                del self.pending[key]
+            future.set_exception(error)
+            raise
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, result)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+            del self.pending[key]
+        future.set_result(result)
+        return result
+
+
+# The aggregates only change when data_integration.py imports new data, so they are cached for a few minutes
+AGGREGATE_CACHE_SIZE = 256
+AGGREGATE_CACHE_TTL = 300
+aggregate_cache = ResultCache(AGGREGATE_CACHE_SIZE, AGGREGATE_CACHE_TTL)
+
+# The columns the delay statistics can be grouped by
+DELAY_GROUPS = {
+    'canton': 'r.Canton',
+    'date': 'r.Date',
+    'product': 'p.ProduktName',
+}
+
+# The weather columns of the daily series
+DAILY_WEATHER_COLUMNS = ['airtemperature_mean', 'airtemperature_min', 'airtemperature_max', 'precipitation',
+                         'totalsnowdepth', 'sunshineduration', 'globalradiation', 'cloudcover', 'pressure',
+                         'relativehumidity']
+
+# The delay statistics of a group of rows of TransportDelayDaily (r)
+DELAY_STATISTICS = """
+        SUM(r.Trips) AS trips,
+        SUM(r.DelayedTrips) AS delayedtrips,
+        SUM(r.CancelledTrips) AS cancelledtrips,
+        SUM(r.DelayedTrips)::double precision / NULLIF(SUM(r.Trips), 0) AS delayrate,
+        SUM(r.CancelledTrips)::double precision / NULLIF(SUM(r.Trips), 0) AS cancellationrate,
+        SUM(r.DelayMinutes)::double precision / NULLIF(SUM(r.DelayedTrips), 0) AS avgdelayminutes"""
+
+
+# Builds the WHERE clause of the aggregate endpoints from the query parameters canton, product (comma separated),
+# start and end (YYYY-MM-DD, end included). Raises ValueError for a date that cannot be read.
+def aggregateFilters():
+    conditions = []
+    params = {}
+    for parameter, column in [('canton', 'r.Canton'), ('product', 'p.ProduktName')]:
+        if parameter in request.args:
+            conditions.append(f"{column} = ANY(:{parameter})")
+            params[parameter] = request.args[parameter].split(',')
+    if 'start' in request.args:
+        conditions.append("r.Date >= :start")
+        params['start'] = date.fromisoformat(request.args['start'])
+    if 'end' in request.args:
+        conditions.append("r.Date <= :end")
+        params['end'] = date.fromisoformat(request.args['end'])
+    where = 'WHERE ' + ' AND '.join(conditions) if conditions else ''
+    return where, params
+
+
+# Runs an aggregate query through aggregate_cache and returns its result as JSON. The cache key is the query with its
+# parameters, so the same request from several clients runs the query once.
+def cachedAggregate(query, params):
+    def compute():
+        rows = db.session.execute(text(query), params).mappings().all()
+        return serializeJson([dict(row) for row in rows])
+
+    key = (query, json.dumps(params, sort_keys=True, default=str))
+    response = Response(aggregate_cache.get(key, compute), mimetype='application/json')
+    response.headers['Cache-Control'] = f'max-age={AGGREGATE_CACHE_TTL}'
+    return response
+
+
+# GET: Delay and cancellation rates from the daily rollup (TransportDelayDaily)
+# command: curl -X GET "http://127.0.0.1:5000/delays?group=canton,product&product=Zug&start=2024-01-01&end=2024-01-31"
+# group is any of canton, date and product (default canton), the filters canton, product, start and end are optional.
+@app.route('/delays', methods=['GET'])
+def get_delays():
+    groups = request.args.get('group', 'canton').split(',')
+    unknown = [group for group in groups if group not in DELAY_GROUPS]
+    if unknown:
+        return jsonify({"error": f"Unknown groups: {', '.join(unknown)}"}), 400
+    try:
+        where, params = aggregateFilters()
+    except ValueError:
+        return jsonify({"error": "start and end need to be dates (YYYY-MM-DD)"}), 400
+
+    columns = ', '.join(f"{DELAY_GROUPS[group]} AS {group}" for group in groups)
+    query = f"""
+    SELECT
+        {columns},{DELAY_STATISTICS}
+    FROM
+        TransportDelayDaily r
+    JOIN
+        Produkt p ON r.ProduktID = p.ProduktID
+    {where}
+    GROUP BY {', '.join(DELAY_GROUPS[group] for group in groups)}
+    ORDER BY {', '.join(DELAY_GROUPS[group] for group in groups)}
+    """
+    return cachedAggregate(query, params)
+
+
+# GET: Daily delay and cancellation rates per canton, together with the weather of the canton on that day
+# (CantonWeatherDaily)
+# command: curl -X GET "http://127.0.0.1:5000/delays/daily?canton=GR&product=Zug&start=2024-01-01&end=2024-03-31"
+# The filters canton, product, start and end are optional.
+@app.route('/delays/daily', methods=['GET'])
+def get_daily_delays():
+    try:
+        where, params = aggregateFilters()
+    except ValueError:
+        return jsonify({"error": "start and end need to be dates (YYYY-MM-DD)"}), 400
+
+    weather = ', '.join(f"w.{column}" for column in DAILY_WEATHER_COLUMNS)
+    query = f"""
+    SELECT
+        r.Date AS date,
+        r.Canton AS canton,{DELAY_STATISTICS},
+        {weather}
+    FROM
+        TransportDelayDaily r
+    JOIN
+        Produkt p ON r.ProduktID = p.ProduktID
+    JOIN
+        CantonWeatherDaily w ON r.Canton = w.Canton AND r.Date = w.Date
+    {where}
+    GROUP BY r.Date, r.Canton, {weather}
+    ORDER BY r.Date, r.Canton
+    """
+    return cachedAggregate(query, params)
+
+
 # Run the App to be able to execute the statements on the table.
 if __name__ == '__main__':
     app.run(debug=True)
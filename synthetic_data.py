@@ -0,0 +1,282 @@
+import numpy as np
+import pandas as pd
+import os
+from data_integration import TRANSPORT_DTYPES, HALTESTELLEN_DTYPES
+
+# This file generates synthetic data in the same shape as the real datasets (IST-Daten, Haltestellen, service points
+# and the NBCN weather stations and measurements), so the integration and the analysis can be tested and timed
+# without downloading the real data. The data only depends on the seed and the scale, so two runs with the same
+# arguments write exactly the same files.
+# The files are written into <root>/datasets with the folder structure described in Manual.md, so running
+# data_integration.py with <root> as working directory imports them.
+
+CANTONS = ['ZH', 'BE', 'LU', 'UR', 'SZ', 'OW', 'NW', 'GL', 'ZG', 'FR', 'SO', 'BS', 'BL', 'SH', 'AR', 'AI', 'SG', 'GR',
+           'AG', 'TG', 'TI', 'VD', 'VS', 'NE', 'GE', 'JU']
+
+# Products of the IST-Daten with their share of the journeys and their VERKEHRSMITTEL_TEXT
+PRODUCTS = ['Bus', 'Zug', 'Tram', 'Schiff', 'Zahnradbahn']
+PRODUCT_SHARES = [0.55, 0.25, 0.15, 0.03, 0.02]
+PRODUCT_VEHICLES = ['B', 'IR', 'T', 'BAT', 'R']
+
+# Scales of the generated data: number of transport stations, weather stations, operators, lines, journeys per day
+# and operating days
+SCALES = {
+    'small': {'stations': 500, 'weather_stations': 30, 'operators': 40, 'lines': 200, 'journeys': 2000,
+              'days': ['2024-01-01', '2024-01-02']},
+    'medium': {'stations': 5000, 'weather_stations': 100, 'operators': 150, 'lines': 2000, 'journeys': 30000,
+               'days': ['2024-01-01', '2024-01-02', '2024-04-01', '2024-07-01', '2024-11-01']},
+    'large': {'stations': 30000, 'weather_stations': 160, 'operators': 400, 'lines': 10000, 'journeys': 150000,
+              'days': [f'2024-{month:02d}-{day:02d}' for month in [1, 4, 7, 11] for day in range(1, 8)]}
+}
+
+# LV95 coordinates of the area the stations are placed in, in meters
+LV95_EAST = (2485000, 2835000)
+LV95_NORTH = (1075000, 1295000)
+
+
+# Approximates WGS84 latitude and longitude from LV95 coordinates, close enough for synthetic stations
+def lv95ToWgs84(east, north):
+    return 46.951 + (north - 1200000) / 111200, 7.439 + (east - 2600000) / 76000
+
+
+# Writes a DataFrame as a csv file, creating its folder
+def writeCsv(df, file_path, delimiter, encoding='utf-8'):
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    df.to_csv(file_path, sep=delimiter, index=False, encoding=encoding)
+
+
+# Generates the weather stations, in the format of the NBCN station list (weatherStation.csv)
+def generateWeatherStations(rng, count):
+    east = rng.uniform(*LV95_EAST, count).round()
+    north = rng.uniform(*LV95_NORTH, count).round()
+    lat, long = lv95ToWgs84(east, north)
+    codes = [f'W{i:02d}' for i in range(count)]
+    return pd.DataFrame({
+        'Station': [f'Weather Station {i}' for i in range(count)],
+        'station/location': codes,
+        'WIGOS-ID': [f'0-20000-0-{6600 + i}' for i in range(count)],
+        'Data since': '1864-01-01',
+        'Station height m. a. sea level': rng.gamma(2.0, 450, count).round() + 200,
+        'CoordinatesE': east.astype(int),
+        'CoordinatesN': north.astype(int),
+        'Latitude': lat.round(5),
+        'Longitude': long.round(5),
+        'Climate region': rng.choice(['Jura', 'Central plateau', 'Alps', 'Southern Alps'], count),
+        'Canton': [CANTONS[i % len(CANTONS)] for i in range(count)],
+        'URL Previous years (verified data)': '',
+        'URL Current year': ''
+    })
+
+
+# Generates the daily measurements of one weather station for the months of the given days, in the format of the
+# NBCN measurement files. About 2% of the values are missing ('-').
+def generateMeasurements(rng, station, height, days):
+    dates = pd.DatetimeIndex(sorted({day for month in {(d.year, d.month) for d in days}
+                                     for day in pd.date_range(f'{month[0]}-{month[1]:02d}-01', periods=31)
+                                     if day.month == month[1]}))
+    count = len(dates)
+    temperature = 12 - 10 * np.cos((dates.dayofyear.to_numpy() - 15) / 366 * 2 * np.pi) - height / 200 \
+        + rng.normal(0, 3, count)
+    measurements = pd.DataFrame({
+        'station/location': station,
+        'date': dates.strftime('%Y%m%d'),
+        'gre000d0': rng.uniform(20, 300, count).round(),
+        'hto000d0': np.where(temperature < 2, rng.gamma(2, 15, count), 0).round(),
+        'nto000d0': rng.uniform(0, 100, count).round(),
+        'prestad0': (1013 - height / 8.5 + rng.normal(0, 5, count)).round(1),
+        'rre150d0': np.where(rng.random(count) < 0.4, rng.gamma(1.2, 6, count), 0).round(1),
+        'sre000d0': rng.uniform(0, 600, count).round(),
+        'tre200d0': temperature.round(1),
+        'tre200dn': (temperature - rng.uniform(2, 8, count)).round(1),
+        'tre200dx': (temperature + rng.uniform(2, 8, count)).round(1),
+        'ure200d0': rng.uniform(40, 100, count).round(1)
+    })
+    values = measurements.columns[2:]
+    missing = rng.random((count, len(values))) < 0.02
+    measurements[values] = measurements[values].astype(object).mask(missing, '-')
+    return measurements
+
+
+# Generates the transport stations: their canton, coordinates and height
+def generateTransportStations(rng, count):
+    east = rng.uniform(*LV95_EAST, count).round()
+    north = rng.uniform(*LV95_NORTH, count).round()
+    lat, long = lv95ToWgs84(east, north)
+    return pd.DataFrame({
+        'bpuic': 8500000 + np.arange(count),
+        'name': [f'Haltestelle {i}' for i in range(count)],
+        'canton': rng.choice(CANTONS, count),
+        'east': east.astype(int),
+        'north': north.astype(int),
+        'lat': lat.round(6),
+        'long': long.round(6),
+        'height': (rng.gamma(2.0, 350, count) + 200).round()
+    })
+
+
+# Generates the Haltestellen file: a few timetable entries per station, with the transport undertaking serving it
+def generateHaltestellen(rng, stations, operators, entries_per_station=3):
+    count = len(stations) * entries_per_station
+    station = np.repeat(np.arange(len(stations)), entries_per_station)
+    operator = rng.integers(0, len(operators), count)
+    haltestellen = pd.DataFrame({
+        'BPUIC': stations['bpuic'].to_numpy()[station],
+        'BP_BEZEICHNUNG': stations['name'].to_numpy()[station],
+        'BP_ABKUERZUNG': [f'H{i}' for i in station],
+        'BP_ID': station + 1,
+        'SLOID': [f'ch:1:sloid:{i}' for i in station],
+        'KANTON': stations['canton'].to_numpy()[station],
+        'FP_ID': np.arange(count) + 1,
+        'TU_CODE': operators['tu_code'].to_numpy()[operator],
+        'TU_BEZEICHNUNG': operators['name'].to_numpy()[operator],
+        'TU_ABKUERZUNG': operators['abk'].to_numpy()[operator],
+        'FARTNUMMER': rng.integers(1, 99999, count),
+        'VM_ART': rng.choice(PRODUCT_VEHICLES, count),
+        'FAHRTAGE': rng.integers(1, 366, count).astype(float),
+        'AB_ZEIT_KB': '2024-01-01',
+        'AN_ZEIT_KB': '2024-12-31',
+        'RICHTUNG_TEXT_AGGREGIERT': [f'Richtung {i}' for i in rng.integers(0, 100, count)],
+        'END_BP_BEZEICHNUNG': stations['name'].to_numpy()[rng.integers(0, len(stations), count)],
+        'LINIE': rng.integers(1, 100, count).astype(str)
+    })
+    return haltestellen[list(HALTESTELLEN_DTYPES)]
+
+
+# Generates the service points export with the coordinates and heights of the stations
+def generateServicePoints(stations):
+    return pd.DataFrame({
+        'number': stations['bpuic'],
+        'sloid': [f'ch:1:sloid:{i}' for i in range(len(stations))],
+        'designationOfficial': stations['name'],
+        'lv95East': stations['east'],
+        'lv95North': stations['north'],
+        'wgs84East': stations['long'],
+        'wgs84North': stations['lat'],
+        'height': stations['height']
+    })
+
+
+# Generates the timetable of one operating day: every journey with its operator, product and line, and its stops
+# with their scheduled minutes after midnight. The timetable is the same for every day, only the delays differ.
+def generateTimetable(rng, stations, operators, lines, journeys):
+    stops = rng.integers(3, 16, journeys)
+    journey = np.repeat(np.arange(journeys), stops)
+    position = np.arange(len(journey)) - np.repeat(np.cumsum(stops) - stops, stops)
+    start = rng.integers(5 * 60, 23 * 60, journeys)
+    interval = rng.integers(2, 7, journeys)
+    product = rng.choice(len(PRODUCTS), journeys, p=PRODUCT_SHARES)
+    operator = rng.integers(0, len(operators), journeys)
+    line = rng.integers(0, lines, journeys)
+
+    arrival = (start[journey] + position * interval[journey]).astype(float)
+    departure = arrival + rng.integers(0, 2, len(journey))
+    first = position == 0
+    last = position == stops[journey] - 1
+    arrival[first] = np.nan
+    departure[last] = np.nan
+
+    return pd.DataFrame({
+        'journey': journey,
+        'product': product[journey],
+        'operator': operator[journey],
+        'line': line[journey],
+        'station': rng.integers(0, len(stations), len(journey)),
+        'arrival': arrival,
+        'departure': departure
+    })
+
+
+# Formats minutes (or seconds) after midnight of a day in the format of the IST-Daten, missing values stay empty
+def formatTimes(day, values, unit, format):
+    return (pd.Timestamp(day) + pd.to_timedelta(values, unit=unit)).strftime(format)
+
+
+# Generates the IST-Daten of one operating day from the timetable. About 30% of the stops are delayed (exponentially
+# distributed) and 1% of the journeys are cancelled.
+def generateIstDaten(rng, day, timetable, stations, operators):
+    count = len(timetable)
+    journey = timetable['journey'].to_numpy()
+    journeys = journey.max() + 1
+    cancelled = (rng.random(journeys) < 0.01)[journey]
+    delay = np.where(rng.random(count) < 0.3, rng.exponential(150, count), 0) + rng.integers(0, 60, count)
+    status = rng.choice(['REAL', 'PROGNOSE', 'UNBEKANNT'], count, p=[0.85, 0.1, 0.05])
+    arrival = timetable['arrival'].to_numpy()
+    departure = timetable['departure'].to_numpy()
+    arrival_prediction = np.where(cancelled, np.nan, arrival * 60 + delay)
+    departure_prediction = np.where(cancelled, np.nan, departure * 60 + delay)
+
+    operator = timetable['operator'].to_numpy()
+    product = timetable['product'].to_numpy()
+    station = timetable['station'].to_numpy()
+    ist_daten = pd.DataFrame({
+        'BETRIEBSTAG': pd.Timestamp(day).strftime('%d.%m.%Y'),
+        'FAHRT_BEZEICHNER': [f'{operators["id"].iat[o]}:{j}:001' for o, j in zip(operator, journey)],
+        'BETREIBER_ID': operators['id'].to_numpy()[operator],
+        'BETREIBER_ABK': operators['abk'].to_numpy()[operator],
+        'BETREIBER_NAME': operators['name'].to_numpy()[operator],
+        'PRODUKT_ID': np.array(PRODUCTS)[product],
+        'LINIEN_ID': timetable['line'].to_numpy() + 1,
+        'LINIEN_TEXT': [f'{PRODUCT_VEHICLES[p]}{line % 100 + 1}' for p, line in zip(product, timetable['line'])],
+        'UMLAUF_ID': '',
+        'VERKEHRSMITTEL_TEXT': np.array(PRODUCT_VEHICLES)[product],
+        'ZUSATZFAHRT_TF': np.where(rng.random(count) < 0.005, 'true', 'false'),
+        'FAELLT_AUS_TF': np.where(cancelled, 'true', 'false'),
+        'BPUIC': stations['bpuic'].to_numpy()[station],
+        'HALTESTELLEN_NAME': stations['name'].to_numpy()[station],
+        'ANKUNFTSZEIT': formatTimes(day, arrival, 'min', '%d.%m.%Y %H:%M'),
+        'AN_PROGNOSE': formatTimes(day, arrival_prediction, 's', '%d.%m.%Y %H:%M:%S'),
+        'AN_PROGNOSE_STATUS': np.where(np.isnan(arrival), '', status),
+        'ABFAHRTSZEIT': formatTimes(day, departure, 'min', '%d.%m.%Y %H:%M'),
+        'AB_PROGNOSE': formatTimes(day, departure_prediction, 's', '%d.%m.%Y %H:%M:%S'),
+        'AB_PROGNOSE_STATUS': np.where(np.isnan(departure), '', status),
+        'DURCHFAHRT_TF': 'false'
+    })
+    return ist_daten[list(TRANSPORT_DTYPES)]
+
+
+# Generates all the datasets at the given scale (see SCALES) into <root>/datasets. Returns the number of rows written
+# per dataset.
+def generateSyntheticData(root, scale='small', seed=0):
+    settings = SCALES[scale] if isinstance(scale, str) else scale
+    rng = np.random.default_rng(seed)
+    datasets = os.path.join(root, 'datasets')
+    days = [pd.Timestamp(day) for day in settings['days']]
+    rows = {}
+
+    weather_stations = generateWeatherStations(rng, settings['weather_stations'])
+    writeCsv(weather_stations, os.path.join(datasets, 'weather', 'weatherStation.csv'), ';', 'ISO-8859-1')
+    rows['weatherstation'] = len(weather_stations)
+    rows['weather'] = 0
+    for station, height in zip(weather_stations['station/location'],
+                               weather_stations['Station height m. a. sea level']):
+        measurements = generateMeasurements(rng, station, height, days)
+        writeCsv(measurements, os.path.join(datasets, 'weather', 'measurements', f'nbcn-daily_{station}.csv'), ';',
+                 'ISO-8859-1')
+        rows['weather'] += len(measurements)
+
+    operator_count = settings['operators']
+    operators = pd.DataFrame({
+        'id': [f'85:{i + 1}' for i in range(operator_count)],
+        'tu_code': np.arange(operator_count) + 1,
+        'abk': [f'OP{i + 1}' for i in range(operator_count)],
+        'name': [f'Transportunternehmen {i + 1}' for i in range(operator_count)]
+    })
+    stations = generateTransportStations(rng, settings['stations'])
+    haltestellen = generateHaltestellen(rng, stations, operators)
+    writeCsv(haltestellen, os.path.join(datasets, 'transport', 'haltestellen_2024', 'haltestellen_2024.csv'), ',')
+    rows['haltestellen'] = len(haltestellen)
+    writeCsv(generateServicePoints(stations),
+             os.path.join(datasets, 'transport', 'service_points', 'service_points.csv'), ';')
+    rows['service_points'] = len(stations)
+
+    timetable = generateTimetable(rng, stations, operators, settings['lines'], settings['journeys'])
+    rows['ist_daten'] = 0
+    for day in days:
+        day_rng = np.random.default_rng([seed, day.toordinal()])
+        ist_daten = generateIstDaten(day_rng, day, timetable, stations, operators)
+        file_path = os.path.join(datasets, 'transport', f'ist-daten-{day:%Y-%m}', f'{day:%Y-%m-%d}_istdaten.csv')
+        writeCsv(ist_daten, file_path, ';')
+        rows['ist_daten'] += len(ist_daten)
+        print(f"Generated {len(ist_daten)} rows: {file_path}")
+
+    return rows
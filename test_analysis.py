@@ -0,0 +1,127 @@
+import os
+import pandas as pd
+import pytest
+from sqlalchemy import create_engine
+import analysis
+import backend
+import data_integration
+import instrumentation
+from synthetic_data import generateSyntheticData
+
+# Runs the analysis on the embedded databases (see backend.py), without a database server. The tables are built from
+# the synthetic data (see synthetic_data.py) by the loaders of data_integration.py, whose writes into Postgres are
+# collected as DataFrames instead, and exported into Parquet files like backend.exportTables does.
+# Run it from the folder of this file with 'python -m pytest test_analysis.py'.
+
+# The codes of the code tables, in the order createTables.sql inserts them
+CODES = {
+    'produkt': ['Zug', 'Bus', 'Tram', 'Metro', 'Zahnradbahn', 'Standseilbahn', 'Luftseilbahn', 'Schiff'],
+    'prognosestatus': ['PROGNOSE', 'REAL', 'GESCHAETZT', 'UNBEKANNT'],
+}
+
+
+# Loads the synthetic data with the loaders of data_integration.py and returns the rows of every table
+def loadSyntheticTables(root):
+    tables = {}
+
+    def collect(df, table, *args):
+        tables.setdefault(table, []).append(df.copy())
+        return len(df)
+
+    with pytest.MonkeyPatch.context() as patch:
+        patch.chdir(root)
+        patch.setattr(data_integration, 'copyToTable', collect)
+        patch.setattr(data_integration, 'copyToTableIgnoreConflicts', collect)
+        patch.setattr(data_integration, 'lookup_codes',
+                      {table: {name: code for code, name in enumerate(names, 1)} for table, names in CODES.items()})
+
+        data_integration.loadWeatherStationFile('datasets/weather/weatherStation.csv', ['weatherstation'], False, None)
+        for file in sorted(os.listdir(data_integration.MEASUREMENT_DIRECTORY)):
+            data_integration.loadWeatherMeasurementFile(
+                os.path.join(data_integration.MEASUREMENT_DIRECTORY, file), ['weather'], False, None)
+        data_integration.loadTransportStationFile(data_integration.HALTESTELLEN_FILE, ['transportstation'], False,
+                                                  None)
+
+        valid_bpuic = pd.concat(tables['transportstation'])['bpuic'].tolist()
+        columns = data_integration.transportColumns(['transportevent'])
+        for file_path in data_integration.listTransportFiles():
+            for chunk in data_integration.readTransportChunks(file_path, columns):
+                frames = data_integration.transformTransportChunk(chunk, valid_bpuic, ['transportevent'])
+                collect(frames['transportevent'], 'transportevent')
+
+    tables = {table: pd.concat(frames, ignore_index=True) for table, frames in tables.items()}
+    # Postgres converts the measurements into numbers while copying them
+    tables['weather'][data_integration.CANTON_WEATHER_COLUMNS] = \
+        tables['weather'][data_integration.CANTON_WEATHER_COLUMNS].apply(pd.to_numeric)
+    # Without the service points file the stations have no coordinates, the analysis uses the height of the canton
+    for column, dtype in [('coorde', 'Int32'), ('coordn', 'Int32'), ('lat', 'Float32'), ('long', 'Float32'),
+                          ('height', 'Int16')]:
+        tables['transportstation'][column] = pd.Series(pd.NA, index=tables['transportstation'].index, dtype=dtype)
+    tables['produkt'] = pd.DataFrame({'produktid': range(1, len(CODES['produkt']) + 1),
+                                      'produktname': CODES['produkt']})
+
+    # The tables that data_integration.py fills with SQL
+    weather = tables['weather'].merge(tables['weatherstation'][['weatherstationname', 'canton']])
+    tables['cantonweatherdaily'] = weather.groupby(['canton', 'date'], as_index=False).agg(
+        stationcount=('weatherstationname', 'size'),
+        **{column: (column, 'mean') for column in data_integration.CANTON_WEATHER_COLUMNS})
+    rollup = data_integration.delayRollup(tables['transportevent'])
+    tables['transportdelaydaily'] = rollup.merge(tables['transportstation'][['bpuic', 'canton']], how='left')
+    tables['ingestionmanifest'] = pd.DataFrame({
+        'filepath': ['datasets/weather/weatherStation.csv', data_integration.HALTESTELLEN_FILE],
+        'targettable': ['weatherstation', 'transportstation'], 'filehash': ['a', 'b'], 'status': 'committed',
+        'finishedat': pd.Timestamp('2024-12-31')})
+    return tables
+
+
+# Builds the embedded database of the backend from the synthetic data, and points the analysis to it
+@pytest.fixture(scope='module', params=['sqlite', 'duckdb'])
+def embeddedBackend(request, tmp_path_factory):
+    root = tmp_path_factory.mktemp('synthetic')
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setattr(instrumentation, 'METRICS_FILE', str(root / 'metrics.jsonl'))
+        generateSyntheticData(str(root), 'small', 0)
+        directory = root / 'embedded'
+        for table, rows in loadSyntheticTables(root).items():
+            os.makedirs(directory / table)
+            rows.to_parquet(directory / table / 'part-00000.parquet', index=False)
+
+        path = str(root / f'analysis.{request.param}')
+        if request.param == 'sqlite':
+            backend.buildSqlite(directory=str(directory), path=path)
+            engine = create_engine(f'sqlite:///{path}')
+        else:
+            backend.buildDuckDb(directory=str(directory), path=path)
+            engine = create_engine(f'duckdb:///{path}', connect_args={'read_only': True})
+
+        patch.setattr(analysis, 'engine', engine)
+        patch.setattr(analysis, 'CACHE_DIRECTORY', str(root / 'cache'))
+        yield root
+        engine.dispose()
+
+
+def test_data_version_is_stable(embeddedBackend):
+    version = analysis.dataVersion()
+    assert version
+    assert analysis.dataVersion() == version
+
+
+def test_train_data_from_events_and_rollup(embeddedBackend):
+    events = analysis.getTrainDataYear()
+    rollup = analysis.getTrainRollupYear()
+    assert len(events) > 0
+    # The rollup counts the same trips as the single events
+    assert rollup['trips'].sum() == len(events)
+    pd.testing.assert_frame_equal(analysis.buildTripCube(events), analysis.buildTripCube(rollup),
+                                  check_dtype=False)
+
+
+def test_plots(embeddedBackend):
+    events = analysis.getTrainDataYear()
+    analysis.analyzeWeatherData(1, 'airtemperature_mean', output=str(embeddedBackend / 'weather.png'))
+    analysis.analyzeDelayByRegionPerMonthViolin(1, 'Zug', output=str(embeddedBackend / 'violin.png'))
+    analysis.heatmapAnalysisWholeYear(events, output=str(embeddedBackend / 'heatmap_{group}.png'))
+    analysis.delayPercentageMonth(1, events, output=str(embeddedBackend / 'delay.png'))
+    analysis.cancellationPercentageMonth(1, pd.DataFrame(), source='rollup',
+                                         output=str(embeddedBackend / 'cancellation.png'))
+    assert len(list(embeddedBackend.glob('*.png'))) == 7